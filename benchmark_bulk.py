@@ -0,0 +1,72 @@
+# Compares marking many participants `failed` one `PATCH /participants` at a
+# time against a single `POST /participants/bulk/status`.
+# Usage: python benchmark_bulk.py --num_workers=10000
+
+import os
+import tempfile
+import time
+
+import fire
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+import main
+from models import Participant
+from synthetic_data import fixture_database
+
+
+def load_fixture(path, num_workers, seed):
+    engine = fixture_database(path, num_workers, seed=seed)
+    with Session(engine) as session:
+        worker_ids = session.exec(select(Participant.worker_id)).all()
+    return engine, worker_ids
+
+
+def use_engine(engine):
+    def get_session():
+        with Session(engine) as session:
+            yield session
+
+    main.app.dependency_overrides[main.get_session] = get_session
+
+
+def benchmark(num_workers=10000, seed=0):
+    """Send every worker_id in a fixture of `num_workers` participants.
+    Both paths leave the ~70% who are already complete untouched."""
+    auth = (main.settings.admin_username, main.settings.admin_password)
+    client = TestClient(main.app)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, worker_ids = load_fixture(
+            os.path.join(tmp_dir, "loop.db"), num_workers, seed
+        )
+        use_engine(engine)
+        start = time.perf_counter()
+        for worker_id in worker_ids:
+            client.patch(
+                "/participants", json={"worker_id": worker_id, "status": "failed"}
+            )
+        loop_time = time.perf_counter() - start
+
+        engine, worker_ids = load_fixture(
+            os.path.join(tmp_dir, "bulk.db"), num_workers, seed
+        )
+        use_engine(engine)
+        start = time.perf_counter()
+        response = client.post(
+            "/participants/bulk/status",
+            json={"worker_ids": worker_ids, "status": "failed"},
+            auth=auth,
+        )
+        num_updated = len(response.text.splitlines())
+        bulk_time = time.perf_counter() - start
+        main.app.dependency_overrides.clear()
+
+    print(f"Sent {len(worker_ids)} worker_ids, updated {num_updated}")
+    print(f"PATCH /participants loop:       {loop_time:6.2f}s")
+    print(f"POST /participants/bulk/status: {bulk_time:6.2f}s")
+    print(f"Speedup: {loop_time / bulk_time:.0f}x")
+
+
+if __name__ == "__main__":
+    fire.Fire(benchmark)
@@ -4,19 +4,23 @@ import ast
 import os
 import sqlite3
 import subprocess
+import time
+from datetime import datetime
 from pathlib import Path
 
 import fire
 import pandas as pd
 import psycopg2
 import uvicorn
+from sqlalchemy import inspect, text
 from sqlmodel import Session, SQLModel
 
 import config
-from models import Data, Participant
+from models import DEFAULT_STUDY_ID, Data, Participant
+from synthetic_data import DEFAULT_NUM_TRIALS
 
 settings = config.Settings()
-TABLE_NAMES = ["participant", "data"]
+TABLE_NAMES = ["study", "participant", "data"]
 DATA_DIR = Path("data/temp/")
 APP_NAME = "lookatfaces"
 
@@ -33,6 +37,32 @@ def drop_tables():
     SQLModel.metadata.drop_all(engine)
 
 
+def migrate_db():
+    """Bring a database created before studies existed up to date, without
+    losing data: creates the study table and adds the study_id columns (set to
+    the default study for existing rows) and their indexes."""
+    from database import engine
+
+    create_tables()
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in [Participant.__table__, Data.__table__]:
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            if "study_id" not in columns:
+                not_null = "" if table.c.study_id.nullable else " NOT NULL"
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN study_id VARCHAR "
+                        f"DEFAULT '{DEFAULT_STUDY_ID}'{not_null}"
+                    )
+                )
+            for index in table.indexes:
+                if "study_id" in index.columns:
+                    index.create(conn, checkfirst=True)
+
+    print("db successfully migrated.")
+
+
 def reset_db():
     drop_tables()
     create_tables()
@@ -40,6 +70,72 @@ def reset_db():
     print("db successfully reset.")
 
 
+def parse_time(value):
+    return value if value is None or isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def seed_db(
+    num_participants=1000,
+    seed=0,
+    num_trials=DEFAULT_NUM_TRIALS,
+    num_studies=1,
+    batch_size=5000,
+    now=None,
+    allotted_time=None,
+):
+    """Bulk-load synthetic participants and trial data into the database.
+    Times are relative to `now` (ISO format; defaults to the current time).
+    See `synthetic_data.bulk_load`."""
+    from database import engine
+    from synthetic_data import bulk_load
+
+    engine.echo = False
+    create_tables()
+    start = time.perf_counter()
+    bulk_load(
+        engine,
+        num_participants,
+        seed=seed,
+        num_trials=num_trials,
+        num_studies=num_studies,
+        batch_size=batch_size,
+        now=parse_time(now),
+        allotted_time=allotted_time,
+    )
+    print(
+        f"Loaded {num_participants} participants in {time.perf_counter() - start:.1f}s"
+    )
+
+
+def seed_fixture(
+    path,
+    num_participants=10000,
+    seed=0,
+    num_trials=DEFAULT_NUM_TRIALS,
+    num_studies=1,
+    now=None,
+):
+    """Write a fresh SQLite fixture database for benchmarks to `path`. Times
+    are relative to `now` (ISO format; defaults to
+    `synthetic_data.FIXTURE_TIME`), so a given seed always gives the same
+    database."""
+    from synthetic_data import FIXTURE_TIME, fixture_database
+
+    start = time.perf_counter()
+    fixture_database(
+        path,
+        num_participants,
+        seed=seed,
+        num_trials=num_trials,
+        num_studies=num_studies,
+        now=parse_time(now) or FIXTURE_TIME,
+    )
+    print(
+        f"Loaded {num_participants} participants into {path} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
 # TODO: fix this whole running part
 def run():
     uvicorn.run("main:app", reload=True)
@@ -62,11 +158,23 @@ def debug():
     run()
 
 
-def export(remote=True):
-    conn = psycopg2.connect(settings.database_url) if remote else sqlite3.connect("database.db")
+def export(remote=True, study_id=None, db_path="database.db"):
+    """Export every table to csv. If `study_id` is given, only that study's
+    rows are exported, to `<table_name>_<study_id>.csv`. `db_path` is the
+    SQLite database to read when not `remote`."""
+    conn = psycopg2.connect(settings.database_url) if remote else sqlite3.connect(db_path)
+    placeholder = "%s" if remote else "?"
     for table_name in TABLE_NAMES:
-        df = pd.read_sql(f"SELECT * from {table_name}", conn)
-        df.to_csv(DATA_DIR / f"{table_name}.csv", index=False)
+        if study_id is None:
+            df = pd.read_sql(f"SELECT * from {table_name}", conn)
+            df.to_csv(DATA_DIR / f"{table_name}.csv", index=False)
+        else:
+            df = pd.read_sql(
+                f"SELECT * from {table_name} WHERE study_id = {placeholder}",
+                conn,
+                params=(study_id,),
+            )
+            df.to_csv(DATA_DIR / f"{table_name}_{study_id}.csv", index=False)
 
 
 def extract_jspsych_data(data_file=DATA_DIR / "data.csv", data_col="json_data"):
@@ -17,6 +17,10 @@ class Settings(BaseSettings):
     shuffle: bool = True
     allotted_time: int = 3600  # in seconds
     refresh_time: int = 300  # in seconds
+    study_cache_ttl: int = 30  # in seconds
+    spool_dir: str = os.path.join(BASE_DIR, "spool")
+    spool_segment_size: int = 16 * 2**20  # in bytes
+    spool_retry_time: float = 5.0  # in seconds
     condition: str = "trustworthy"
     environment_type: str = "debug"
     admin_username: str = "username_to_be_set_in_env_file_not_here"
@@ -41,3 +45,23 @@ class Settings(BaseSettings):
 
     class Config:
         env_file = ".env"
+
+
+# The public settings, in the order sent to the frontend. A study may
+# override any of them (see `StudyConfigurationIn`).
+PUBLIC_SETTINGS = [
+    "debug_mode",
+    "estimated_task_duration",
+    "compensation",
+    "experiment_title",
+    "experiment_name",
+    "version_date",
+    "open_tags",
+    "close_tags",
+    "logrocket_id",
+    "intertrial_interval",
+    "stimulus_width",
+    "stimulus_height",
+    "slider_width",
+    "num_stimuli",
+]
@@ -0,0 +1,31 @@
+# Shared by the tests that run the app in-process (test_bulk.py,
+# test_studies.py). Like test_spool.py, they do not need a running server or
+# the local database.
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import main
+
+AUTH = (main.settings.admin_username, main.settings.admin_password)
+
+
+@pytest.fixture
+def use_engine():
+    """Returns a function that points the app's sessions at `engine` and
+    returns a client for it. The override and the study cache are reset
+    after the test."""
+
+    def use(engine):
+        def get_session():
+            with Session(engine) as session:
+                yield session
+
+        main.app.dependency_overrides[main.get_session] = get_session
+        return TestClient(main.app)
+
+    main.study_registry.invalidate()
+    yield use
+    main.app.dependency_overrides.clear()
+    main.study_registry.invalidate()
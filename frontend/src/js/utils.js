@@ -43,6 +43,11 @@ export function getWorkerInfo() {
   return { ...jsPsych.turk.turkInfo(), platform };
 }
 
+// Which study this link belongs to; omitted for single-study deployments
+export function getStudyId() {
+  return jsPsych.data.getURLVariable("studyId") || "default";
+}
+
 export async function getExperimentInfo({ worker_info }) {
   if (worker_info.platform === "prolific") {
     worker_info = {
@@ -69,6 +74,8 @@ export async function getExperimentInfo({ worker_info }) {
 
 
 
+  worker_info = { ...worker_info, study_id: getStudyId() };
+
   const response = await fetch("/init", {
     method: "POST",
     headers: {
@@ -490,6 +497,7 @@ export async function saveData({
       url: "/data", // path to the script that will handle saving data
       data: JSON.stringify({
         json_data: data,
+        study_id: getStudyId(),
         worker_id,
         assignment_id,
         hit_id,
@@ -565,6 +573,7 @@ export async function updateParticipantStatus({
       url: "/participants", // path to the script that will handle saving data
       data: JSON.stringify({
         worker_id,
+        study_id: getStudyId(),
         status,
       }),
     })
@@ -1,5 +1,6 @@
 # authentication for data export
 
+import json
 import logging
 import random
 import secrets
@@ -12,26 +13,36 @@ from typing import Annotated, List, Optional
 
 import uvicorn
 from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.staticfiles import StaticFiles
 from fastapi_utils.tasks import repeat_every
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlmodel import Field, Session, SQLModel, create_engine, func, select, update
 
 import config
 from database import engine
 from models import (
+    DEFAULT_STUDY_ID,
     POSSIBLE_PARTICIPANT_STATUSES,
     Data,
     ExperimentConfiguration,
     Participant,
+    ParticipantBulkFilter,
+    ParticipantBulkUpdate,
     ParticipantDataIn,
     ParticipantIn,
     ParticipantOut,
     ParticipantUpdate,
+    Study,
+    StudyIn,
 )
+from spool import DataSpool
+from studies import StudyRegistry
 
 
 @lru_cache()
@@ -44,25 +55,29 @@ def get_session():
         yield session
 
 
+# Errors from a database that is down or slow, rather than from the data
+DATABASE_RETRY_EXCEPTIONS = (OperationalError, InterfaceError, PoolTimeoutError)
+
+
+@lru_cache()
+def get_data_spool():
+    settings = get_settings()
+    return DataSpool(
+        settings.spool_dir,
+        handler=drain_subject_data,
+        key=itemgetter("study_id", "worker_id"),
+        retry_exceptions=DATABASE_RETRY_EXCEPTIONS,
+        segment_size=settings.spool_segment_size,
+        retry_time=settings.spool_retry_time,
+    )
+
+
 # Set up settings
 settings = get_settings()
 
-experiment_configuration_dict = dict(
-    debug_mode=settings.debug_mode,
-    estimated_task_duration=settings.estimated_task_duration,
-    compensation=settings.compensation,
-    experiment_title=settings.experiment_title,
-    experiment_name=settings.experiment_name,
-    version_date=settings.version_date,
-    open_tags=settings.open_tags,
-    close_tags=settings.close_tags,
-    logrocket_id=settings.logrocket_id,
-    intertrial_interval=settings.intertrial_interval,
-    stimulus_width=settings.stimulus_width,
-    stimulus_height=settings.stimulus_height,
-    slider_width=settings.slider_width,
-    num_stimuli=settings.num_stimuli,
-)
+experiment_configuration_dict = {
+    name: getattr(settings, name) for name in config.PUBLIC_SETTINGS
+}
 
 app_name = settings.app_name
 
@@ -75,6 +90,24 @@ openapi_url = "/openapi.json" if environment_type != "production" else None
 docs_url = "/docs" if environment_type != "production" else None
 redoc_url = "/redoc" if environment_type != "production" else None
 
+# Per-study configuration; the default study is served straight from settings
+study_registry = StudyRegistry(
+    experiment_configuration=experiment_configuration_dict,
+    condition=condition,
+    allotted_time=allotted_time,
+    ttl=settings.study_cache_ttl,
+)
+
+
+def get_study(session: Session, study_id: str):
+    study = study_registry.get(session, study_id)
+    if study is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown study {study_id}",
+        )
+    return study
+
 # Set up app
 app = FastAPI(openapi_url=openapi_url, docs_url=docs_url, redoc_url=redoc_url)
 
@@ -154,7 +187,9 @@ def update_participant(
     *, session: Session = Depends(get_session), participant_update: ParticipantUpdate
 ):
     participant = session.exec(
-        select(Participant).where(Participant.worker_id == participant_update.worker_id)
+        select(Participant)
+        .where(Participant.study_id == participant_update.study_id)
+        .where(Participant.worker_id == participant_update.worker_id)
     ).first()
 
     if not participant.status:
@@ -184,25 +219,97 @@ def update_participant(
     return participant
 
 
-@app.post("/data")
-def post_subject_data(
-    *, session: Session = Depends(get_session), data: ParticipantDataIn
-):
-    # Create trial data
-    print("here")
-    print(f"data: {data.json_data}")
-    trial_data = Data(condition=data.condition, json_data=data.json_data)
-    session.add(trial_data)
-    session.commit()
-    session.refresh(trial_data)
+# Size of the IN (...) lists used where a statement has to stay below
+# SQLite's limit on bound parameters
+BULK_CHUNK_SIZE = 5000
 
-    # update participant
 
+def chunked(items, size=BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def participant_filter_conditions(filters: ParticipantBulkFilter, worker_ids=None):
+    """The WHERE conditions for a bulk filter. `worker_ids` replaces the
+    filter's own list, for running it a chunk at a time."""
+    if not (
+        filters.worker_ids is not None
+        or filters.statuses
+        or filters.started_before
+        or filters.started_after
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Bulk operations need at least one filter besides study_id",
+        )
+
+    conditions = [Participant.study_id == filters.study_id]
+    if filters.worker_ids is not None:
+        worker_ids = filters.worker_ids if worker_ids is None else worker_ids
+        conditions.append(Participant.worker_id.in_(worker_ids))
+    if filters.statuses:
+        conditions.append(Participant.status.in_(filters.statuses))
+    if filters.started_before:
+        conditions.append(Participant.start_time < filters.started_before)
+    if filters.started_after:
+        conditions.append(Participant.start_time >= filters.started_after)
+    return conditions
+
+
+def chunked_filter_conditions(filters: ParticipantBulkFilter):
+    """`participant_filter_conditions`, split into one list of conditions
+    per chunk of `worker_ids`."""
+    if filters.worker_ids is None:
+        return [participant_filter_conditions(filters)]
+    worker_ids = list(dict.fromkeys(filters.worker_ids))
+    return [
+        participant_filter_conditions(filters, worker_ids=chunk)
+        for chunk in chunked(worker_ids)
+    ] or [participant_filter_conditions(filters)]
+
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps(jsonable_encoder(row)) + "\n"
+
+
+def save_subject_data(session: Session, data: ParticipantDataIn):
+    """Store a participant's trial data and mark them complete, in one
+    transaction. Since spooled submissions can be replayed, data identical to
+    the participant's latest data is not saved again; different data (e.g.
+    from running the experiment again) is."""
     participant = session.exec(
-        select(Participant).where(Participant.worker_id == data.worker_id)
+        select(Participant)
+        .where(Participant.study_id == data.study_id)
+        .where(Participant.worker_id == data.worker_id)
     ).first()
 
-    participant.worker_id = data.worker_id
+    if participant is None:
+        raise ValueError(
+            f"Got data for participant {data.worker_id} in study {data.study_id}, "
+            "who does not exist"
+        )
+
+    if participant.data_id is not None:
+        latest = session.get(Data, participant.data_id)
+        if latest is not None and latest.json_data == data.json_data:
+            logger.info(
+                f"Participant {participant.worker_id} already has this data; "
+                "skipping replay"
+            )
+            return
+
+    # Create trial data
+    trial_data = Data(
+        study_id=data.study_id,
+        worker_id=participant.worker_id,
+        condition=data.condition,
+        json_data=data.json_data,
+    )
+    session.add(trial_data)
+    session.flush()
+
+    # update participant
     participant.status = "complete"
     participant.end_time = datetime.utcnow()
     participant.data = trial_data
@@ -210,14 +317,21 @@ def post_subject_data(
 
     session.add(participant)
     session.commit()
-    session.refresh(participant)
 
-    trial_data.participant = participant
-    trial_data.worker_id = participant.worker_id
 
-    session.add(trial_data)
-    session.commit()
-    session.refresh(trial_data)
+def drain_subject_data(record):
+    with Session(engine) as session:
+        save_subject_data(session, ParticipantDataIn(**record))
+
+
+@app.post("/data")
+def post_subject_data(
+    *, data_spool: DataSpool = Depends(get_data_spool), data: ParticipantDataIn
+):
+    """Accept a participant's trial data. The data is written to the local
+    spool and saved to the database in the background, so a slow or
+    unavailable database does not lose it."""
+    data_spool.append(data.dict())
 
 
 @app.get("/participants")
@@ -225,11 +339,151 @@ async def read_participants(
     *,
     username: str = Depends(get_current_username),
     session: Session = Depends(get_session),
+    study_id: Optional[str] = None,
 ):
-    participants = session.exec(select(Participant)).all()
+    query = select(Participant)
+    if study_id is not None:
+        query = query.where(Participant.study_id == study_id)
+    participants = session.exec(query).all()
     return participants
 
 
+@app.post("/participants/bulk/status")
+def bulk_update_participants(
+    *,
+    username: str = Depends(get_current_username),
+    session: Session = Depends(get_session),
+    participant_update: ParticipantBulkUpdate,
+):
+    """Set the status (and optionally start/end time) of every participant
+    matching the filters, in one transaction. As with `PATCH /participants`,
+    participants who are already complete are left alone. Streams the
+    updated participants as NDJSON."""
+    # Only saving data (`/data`) completes a participant
+    allowed_statuses = (
+        POSSIBLE_PARTICIPANT_STATUSES["working"]
+        + POSSIBLE_PARTICIPANT_STATUSES["incomplete"]
+    )
+    if participant_update.status not in allowed_statuses:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Bulk updates can only set the status to {allowed_statuses}",
+        )
+    not_complete = Participant.status != "complete"
+    values = {"status": participant_update.status}
+    if participant_update.start_time:
+        values["start_time"] = participant_update.start_time
+    if participant_update.end_time:
+        values["end_time"] = participant_update.end_time
+
+    table = Participant.__table__
+    if session.bind.dialect.full_returning:
+        # Postgres: a single UPDATE ... RETURNING
+        conditions = participant_filter_conditions(participant_update)
+        rows = session.execute(
+            update(table)
+            .where(*conditions, not_complete)
+            .values(**values)
+            .returning(*table.c)
+        ).all()
+        session.commit()
+        participants = [Participant(**row._mapping) for row in rows]
+    else:
+        # SQLite (no RETURNING in SQLAlchemy 1.4): find the matching ids and
+        # update those, in chunks to stay under the bound-parameter limit.
+        # BEGIN IMMEDIATE takes the write lock up front, so no participant
+        # can change (e.g. complete) between the SELECT and the UPDATE.
+        session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+        ids = []
+        for conditions in chunked_filter_conditions(participant_update):
+            ids.extend(
+                session.exec(
+                    select(Participant.id).where(*conditions, not_complete)
+                ).all()
+            )
+        for chunk in chunked(ids):
+            session.execute(
+                update(table).where(table.c.id.in_(chunk)).values(**values)
+            )
+        session.commit()
+        participants = []
+        for chunk in chunked(ids):
+            participants.extend(
+                session.exec(select(Participant).where(Participant.id.in_(chunk)))
+            )
+
+    logger.info(
+        f"Bulk updated {len(participants)} participants in {participant_update.study_id} "
+        f"to {participant_update.status}"
+    )
+    return StreamingResponse(ndjson(participants), media_type="application/x-ndjson")
+
+
+@app.post("/participants/bulk/data")
+def bulk_read_participant_data(
+    *,
+    username: str = Depends(get_current_username),
+    session: Session = Depends(get_session),
+    filters: ParticipantBulkFilter,
+):
+    """Stream the participants matching the filters, each with their trial
+    data (`data`, null if they have none), as NDJSON."""
+    chunked_conditions = chunked_filter_conditions(filters)
+    bind = session.bind
+
+    def rows():
+        # The request's session is closed once streaming starts
+        with Session(bind) as stream_session:
+            for conditions in chunked_conditions:
+                results = stream_session.exec(
+                    select(Participant, Data)
+                    .join(Data, Participant.data_id == Data.id, isouter=True)
+                    .where(*conditions)
+                    .order_by(Participant.id)
+                    .execution_options(yield_per=1000)
+                )
+                for participant, data in results:
+                    yield {**participant.dict(), "data": data}
+
+    return StreamingResponse(ndjson(rows()), media_type="application/x-ndjson")
+
+
+@app.get("/studies")
+def read_studies(
+    *,
+    username: str = Depends(get_current_username),
+    session: Session = Depends(get_session),
+):
+    studies = session.exec(select(Study)).all()
+    return studies
+
+
+@app.put("/studies/{study_id}", response_model=Study)
+def upsert_study(
+    *,
+    username: str = Depends(get_current_username),
+    session: Session = Depends(get_session),
+    study_id: str,
+    study_in: StudyIn,
+):
+    """Register a study, or replace the configuration of an existing one."""
+    study = session.exec(select(Study).where(Study.study_id == study_id)).first()
+    if not study:
+        study = Study(study_id=study_id)
+
+    study.condition = study_in.condition
+    study.allotted_time = study_in.allotted_time
+    study.configuration = study_in.configuration.dict(exclude_unset=True)
+    study.updated_at = datetime.utcnow()
+
+    session.add(study)
+    session.commit()
+    session.refresh(study)
+    study_registry.invalidate(study_id)
+    logger.info(f"Registered study {study_id}")
+    return study
+
+
 @app.get("/info")
 def info(
     *,
@@ -247,12 +501,18 @@ def get_status(
     *,
     username: str = Depends(get_current_username),
     session: Session = Depends(get_session),
+    study_id: Optional[str] = None,
 ):
-    """Log a summary of all the participants' status codes."""
-    participants = session.exec(select(Participant)).all()
-    counts = Counter([p.status for p in participants])
-    sorted_counts = sorted(counts.items(), key=itemgetter(0))
-    logger.info(f"Status summary: {str(sorted_counts)}")
+    """Log a summary of the participants' status codes, for one study if
+    `study_id` is given and for all of them otherwise."""
+    query = select(Participant.status, func.count(Participant.id))
+    if study_id is not None:
+        query = query.where(Participant.study_id == study_id)
+    counts = session.exec(query.group_by(Participant.status)).all()
+    sorted_counts = sorted((tuple(row) for row in counts), key=itemgetter(0))
+    logger.info(
+        f"Status summary for {study_id or 'all studies'}: {str(sorted_counts)}"
+    )
     return sorted_counts
 
 
@@ -266,9 +526,13 @@ def initialize_experiment(
     Creates a participant.
     """
 
+    study = get_study(session, participant_in.study_id)
+
     # Make sure participant does not already exist; if so, return that
     existing_participant = session.exec(
-        select(Participant).where(Participant.worker_id == participant_in.worker_id)
+        select(Participant)
+        .where(Participant.study_id == study.study_id)
+        .where(Participant.worker_id == participant_in.worker_id)
     ).first()
 
     print("checked for existing participant")
@@ -293,7 +557,7 @@ def initialize_experiment(
             # num_stimuli=settings.num_stimuli,
             # percent_repeats=settings.percent_repeats,
             # min_gap_between_repeats=settings.min_gap_between_repeats,
-            **experiment_configuration_dict,
+            **study.experiment_configuration,
             **existing_participant.dict(),
         )
 
@@ -301,11 +565,12 @@ def initialize_experiment(
 
     # Create participant
     participant = Participant(
+        study_id=study.study_id,
         worker_id=participant_in.worker_id,
         hit_id=participant_in.hit_id,
         assignment_id=participant_in.assignment_id,
         platform=participant_in.platform,
-        condition=condition,
+        condition=study.condition,
         status="started",
     )
 
@@ -316,34 +581,62 @@ def initialize_experiment(
     session.refresh(participant)
 
     experiment_configuration = ExperimentConfiguration(
-        **experiment_configuration_dict,
+        **study.experiment_configuration,
         **participant.dict(),
     )
     return experiment_configuration
 
 
 @app.on_event("startup")
-@repeat_every(seconds=refresh_time)
-@app.get("/refresh")
-def update_incomplete_participants():
-    with Session(engine) as session:
-        # Find expired participants
-        now = datetime.utcnow()
-        min_start_time = now - timedelta(seconds=allotted_time)
+def start_data_spool():
+    get_data_spool().start()
+
+
+@app.on_event("shutdown")
+def stop_data_spool():
+    get_data_spool().close()
+
+
+def time_out_participants(session: Session, now: Optional[datetime] = None):
+    """Mark working participants who have run past their study's allotted
+    time as timed out. Returns the updated participants."""
+    # Find expired participants, study by study, since each study can have
+    # its own allotted time
+    now = now or datetime.utcnow()
+    working = POSSIBLE_PARTICIPANT_STATUSES["working"]
+    study_ids = session.exec(
+        select(Participant.study_id)
+        .where(Participant.end_time.is_(None))
+        .where(Participant.status.in_(working))
+        .distinct()
+    ).all()
+    updated_participants = []
+    for study_id in study_ids:
+        study = study_registry.get(session, study_id) or study_registry.default
+        min_start_time = now - timedelta(seconds=study.allotted_time)
         participants = session.exec(
             select(Participant)
+            .where(Participant.study_id == study_id)
             .where(Participant.end_time.is_(None))
-            .where(Participant.status.in_(POSSIBLE_PARTICIPANT_STATUSES["working"]))
+            .where(Participant.status.in_(working))
+            .where(Participant.start_time < min_start_time)
         ).all()
-        updated_participants = []
         for participant in participants:
-            if participant.start_time < min_start_time:
-                participant.status = "timeout"
-                session.add(participant)
-                updated_participants.append(participant)
-        session.commit()
-        for p in updated_participants:
-            session.refresh(p)
+            participant.status = "timeout"
+            session.add(participant)
+            updated_participants.append(participant)
+    session.commit()
+    for p in updated_participants:
+        session.refresh(p)
+    return updated_participants
+
+
+@app.on_event("startup")
+@repeat_every(seconds=refresh_time)
+@app.get("/refresh")
+def update_incomplete_participants():
+    with Session(engine) as session:
+        updated_participants = time_out_participants(session)
         logger.info(f"Updated participants: {updated_participants}")
 
 
@@ -1,9 +1,11 @@
 from datetime import datetime, timezone
-from pydantic import root_validator
-from sqlalchemy import Column
+from pydantic import create_model, root_validator
+from sqlalchemy import Column, Index
 from sqlmodel import Field, Relationship, Session, SQLModel, select, JSON
 from typing import Optional, List, Dict
 
+import config
+
 
 POSSIBLE_PARTICIPANT_STATUSES = {
     "working": [
@@ -19,6 +21,53 @@ POSSIBLE_PARTICIPANT_STATUSES = {
     "incomplete": ["timeout", "failed"],
 }
 
+# Participants and data that arrive without a study id belong to this study,
+# whose configuration comes straight from `config.Settings`.
+DEFAULT_STUDY_ID = "default"
+
+
+class Study(SQLModel, table=True):
+    """The experiment registry. One row per study served by this deployment.
+    `configuration` holds overrides for the public experiment configuration
+    (e.g. experiment_name, version_date, num_stimuli); anything left unset
+    falls back to `config.Settings`.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    study_id: str = Field(index=True, unique=True)
+    condition: Optional[str]
+    allotted_time: Optional[int]  # in seconds
+    configuration: Dict = Field(default_factory=dict, sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+    # Needed for Column(JSON)
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class ForbidExtra:
+    extra = "forbid"
+
+
+# The public `ExperimentConfiguration` fields a study may override, typed as
+# in `config.Settings`. Participant fields (worker_id, condition, status, ...)
+# are rejected.
+StudyConfigurationIn = create_model(
+    "StudyConfigurationIn",
+    __config__=ForbidExtra,
+    **{
+        name: (Optional[config.Settings.__fields__[name].outer_type_], None)
+        for name in config.PUBLIC_SETTINGS
+    },
+)
+
+
+class StudyIn(SQLModel):
+    condition: Optional[str]
+    allotted_time: Optional[int]
+    configuration: StudyConfigurationIn = StudyConfigurationIn()
+
 
 class Participant(SQLModel, table=True):
     """The participant model.
@@ -32,9 +81,14 @@ class Participant(SQLModel, table=True):
     - failed
     """
 
+    __table_args__ = (
+        Index("ix_participant_study_id_worker_id", "study_id", "worker_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    study_id: str = Field(default=DEFAULT_STUDY_ID, nullable=False)
     worker_id: Optional[str] = Field(index=True)  # prolific_pid
-    hit_id: Optional[str]  # study_id
+    hit_id: Optional[str]  # platform study id
     assignment_id: Optional[str]  # session_id
     platform: Optional[str]  # prolific or mturk or cloudresearch
     condition: Optional[str]
@@ -51,6 +105,7 @@ class Participant(SQLModel, table=True):
 
 class ParticipantUpdate(SQLModel):
     worker_id: str
+    study_id: str = DEFAULT_STUDY_ID
     status: str
     start_time: Optional[datetime]
     end_time: Optional[datetime]
@@ -58,8 +113,26 @@ class ParticipantUpdate(SQLModel):
     data_id: Optional[int]
 
 
+class ParticipantBulkFilter(SQLModel):
+    """Selects participants in one study for a bulk operation. Every filter
+    that is set must match."""
+
+    study_id: str = DEFAULT_STUDY_ID
+    worker_ids: Optional[List[str]]
+    statuses: Optional[List[str]]
+    started_before: Optional[datetime]
+    started_after: Optional[datetime]
+
+
+class ParticipantBulkUpdate(ParticipantBulkFilter):
+    status: str
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+
+
 class ParticipantIn(SQLModel):
     worker_id: str
+    study_id: str = DEFAULT_STUDY_ID
     hit_id: str
     assignment_id: str
     platform: str
@@ -67,6 +140,7 @@ class ParticipantIn(SQLModel):
 
 class ParticipantOut(SQLModel):
     worker_id: str
+    study_id: str
     status: str
     condition: str
     data_id: Optional[int]
@@ -76,7 +150,8 @@ class ParticipantOut(SQLModel):
 
 class ParticipantDataIn(SQLModel):
     worker_id: str
-    hit_id: Optional[str]  # study_id
+    study_id: str = DEFAULT_STUDY_ID
+    hit_id: Optional[str]  # platform study id
     assignment_id: Optional[str]  # session_id
     platform: Optional[str]  # prolific or mturk or cloudresearch
     condition: Optional[str]
@@ -92,6 +167,7 @@ class Data(SQLModel, table=True):
     participant: Optional[Participant] = Relationship(
         sa_relationship_kwargs={"uselist": False}, back_populates="data"
     )
+    study_id: Optional[str] = Field(default=None, index=True)
     worker_id: Optional[str]
     condition: Optional[str]
     json_data: List[Dict] = Field(sa_column=Column(JSON))
@@ -103,6 +179,7 @@ class Data(SQLModel, table=True):
 
 class ExperimentConfiguration(SQLModel):
     worker_id: str
+    study_id: str = DEFAULT_STUDY_ID
     status: str
     condition: str = "happy"
     data_id: Optional[int]
@@ -0,0 +1,412 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from itertools import count
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_FORMAT = "segment-{:08d}.log"
+CHECKPOINT_NAME = "checkpoint"
+REJECTED_NAME = "rejected.log"
+
+
+def lock_spool_directory(directory):
+    """Take the exclusive lock on a slot directory. Returns the open lock
+    file, or None if another process holds it."""
+    directory.mkdir(parents=True, exist_ok=True)
+    lock_file = open(directory / "lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def claim_spool_directory(root):
+    """Claim the first unused slot directory under `root`.
+
+    Each process (e.g. each gunicorn worker) needs its own slot, because
+    segment files are only ever appended to by one writer. The slot is held
+    by an exclusive lock for as long as the returned lock file stays open,
+    so a restarted process picks up (and replays) the slot of the process it
+    replaced. Slots above it that no process claims are drained as orphans
+    (see `DataSpool`).
+    """
+    for i in count():
+        directory = Path(root) / str(i)
+        lock_file = lock_spool_directory(directory)
+        if lock_file is not None:
+            return directory, lock_file
+
+
+class DataSpool:
+    """Append-only write-ahead spool in front of the database.
+
+    `append` writes a record to the current segment file and returns once it
+    has been fsynced; concurrent appends share a single fsync. A background
+    thread feeds the records to `handler` in order, retrying exceptions in
+    `retry_exceptions` until they succeed, and records its progress in a
+    checkpoint file so that a restart replays whatever was not yet handled.
+    Records that fail with any other exception are moved to `rejected.log`.
+
+    A record is delivered at least once, so `handler` must tolerate replays.
+    While a record is waiting to be handled, further records with the same
+    `key` are dropped.
+
+    The background thread also drains orphaned slots: unlocked slots above
+    this one, left with pending records by a process that is not coming back
+    (e.g. after lowering the number of gunicorn workers).
+    """
+
+    def __init__(
+        self,
+        root,
+        handler,
+        key=lambda record: record["worker_id"],
+        retry_exceptions=(Exception,),
+        segment_size=16 * 2**20,
+        retry_time=5.0,
+        directory=None,
+    ):
+        """Pass `directory` to open that slot instead of claiming the first
+        free one; raises BlockingIOError if it is taken."""
+        self.root = Path(root)
+        if directory is None:
+            self.directory, self._lock_file = claim_spool_directory(root)
+        else:
+            self.directory = Path(directory)
+            self._lock_file = lock_spool_directory(self.directory)
+            if self._lock_file is None:
+                raise BlockingIOError(f"Spool directory {directory} is in use")
+        self.handler = handler
+        self.key = key
+        self.retry_exceptions = retry_exceptions
+        self.segment_size = segment_size
+        self.retry_time = retry_time
+
+        self._cond = threading.Condition()
+        self._pending = Counter()
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._torn = False  # the current segment may end in a partial line
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._orphans = {}  # directory -> DataSpool
+
+        self._read_segment, self._read_offset = self._load_checkpoint()
+        for record in self._replay():
+            self._pending[self.key(record)] += 1
+        if self._pending:
+            logger.info(
+                f"Replaying {sum(self._pending.values())} spooled records "
+                f"from {self.directory}"
+            )
+
+        # Never append to a segment left by a previous process: its tail
+        # may be a torn write. The new segment is created on first append.
+        segments = self._segments()
+        self._write_segment = (segments[-1] if segments else 0) + 1
+        self._file = None
+
+    # Segment and checkpoint files
+
+    def _segment_path(self, segment):
+        return self.directory / SEGMENT_FORMAT.format(segment)
+
+    def _segments(self):
+        return sorted(
+            int(path.stem.split("-")[1]) for path in self.directory.glob("segment-*.log")
+        )
+
+    def _open_segment(self, segment):
+        file = open(self._segment_path(segment), "ab", buffering=0)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        return file
+
+    def _load_checkpoint(self):
+        try:
+            checkpoint = json.loads((self.directory / CHECKPOINT_NAME).read_text())
+            return checkpoint["segment"], checkpoint["offset"]
+        except (FileNotFoundError, ValueError, KeyError):
+            segments = self._segments()
+            return (segments[0] if segments else 1), 0
+
+    def _save_checkpoint(self):
+        path = self.directory / CHECKPOINT_NAME
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"segment": self._read_segment, "offset": self._read_offset})
+        )
+        os.replace(tmp_path, path)
+
+    def _read_next(self):
+        """Return (line, size) for the next complete line, or None."""
+        try:
+            with open(self._segment_path(self._read_segment), "rb") as file:
+                file.seek(self._read_offset)
+                line = file.readline()
+        except FileNotFoundError:
+            line = b""
+        if not line.endswith(b"\n"):
+            return None
+        return line, len(line)
+
+    def _advance_segment(self):
+        """Move the reader past a finished segment. Returns False if the
+        reader is already on the last segment."""
+        later = [s for s in self._segments() if s > self._read_segment]
+        if not later:
+            return False
+        # A later segment only exists once this one is closed for writing,
+        # but a record may have landed since the last read.
+        if self._read_next() is not None:
+            return True
+        finished = self._segment_path(self._read_segment)
+        self._read_segment, self._read_offset = later[0], 0
+        self._save_checkpoint()
+        finished.unlink(missing_ok=True)
+        return True
+
+    def _replay(self):
+        """Yield every record from the checkpoint onwards, without
+        consuming them."""
+        segment, offset = self._read_segment, self._read_offset
+        for s in self._segments():
+            if s < segment:
+                continue
+            with open(self._segment_path(s), "rb") as file:
+                file.seek(offset if s == segment else 0)
+                for line in file:
+                    if line.endswith(b"\n"):
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            pass  # rejected when the drain reaches it
+
+    # Writing
+
+    def append(self, record):
+        """Durably spool `record`. Returns False if a record with the same
+        key is already waiting to be handled."""
+        line = (json.dumps(record, default=str) + "\n").encode()
+        with self._cond:
+            key = self.key(record)
+            if key in self._pending:
+                return False
+            if self._file is None:
+                self._file = self._open_segment(self._write_segment)
+            else:
+                while self._torn and self._syncing:
+                    self._cond.wait()
+                if self._torn or (
+                    not self._syncing and self._file.tell() >= self.segment_size
+                ):
+                    self._roll()
+            self._write(line)
+            self._pending[key] += 1
+            self._written += 1
+            seq = self._written
+
+            # Group commit: one thread fsyncs on behalf of everyone waiting
+            while self._synced < seq:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written
+                fileno = self._file.fileno()
+                self._cond.release()
+                try:
+                    os.fsync(fileno)
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._cond.notify_all()
+                self._synced = max(self._synced, target)
+
+        self._wakeup.set()
+        return True
+
+    def _write(self, line):
+        """Write all of `line` to the current segment, or raise. A partial
+        line (e.g. from a full disk) is truncated away; if that fails too,
+        the segment is rolled before the next append, leaving the partial
+        line as the tail of a finished segment, which the reader skips."""
+        offset = self._file.tell()
+        view = memoryview(line)
+        try:
+            while view:
+                view = view[self._file.write(view) :]
+        except OSError:
+            try:
+                self._file.truncate(offset)
+            except OSError:
+                self._torn = True
+            raise
+
+    def _roll(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._write_segment += 1
+        self._file = self._open_segment(self._write_segment)
+        self._torn = False
+
+    # Draining
+
+    def _handle(self, record):
+        """Hand one record to the handler. Returns False if it should be
+        retried."""
+        try:
+            self.handler(record)
+        except self.retry_exceptions as e:
+            logger.warning(f"Could not save spooled record, will retry: {e}")
+            return False
+        except Exception:
+            logger.exception(f"Rejected spooled record for {self.key(record)}")
+            self._reject(json.dumps(record).encode() + b"\n")
+        return True
+
+    def _reject(self, line):
+        with open(self.directory / REJECTED_NAME, "ab") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def drain(self):
+        """Handle spooled records until there are none left or the handler
+        asks for a retry. Returns the number of records handled."""
+        handled = 0
+        while not self._stop.is_set():
+            next_record = self._read_next()
+            if next_record is None:
+                if self._advance_segment():
+                    continue
+                break
+            line, size = next_record
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.error(f"Rejected unreadable line in {self.directory}")
+                self._reject(line)
+                self._read_offset += size
+                self._save_checkpoint()
+                continue
+            if not self._handle(record):
+                break
+            self._read_offset += size
+            with self._cond:
+                key = self.key(record)
+                self._pending[key] -= 1
+                if self._pending[key] <= 0:
+                    del self._pending[key]
+            handled += 1
+            # If this fails the record is replayed after a restart, which
+            # the handler tolerates
+            self._save_checkpoint()
+        return handled
+
+    def _adopt_orphans(self):
+        slots = [
+            path
+            for path in self.root.iterdir()
+            if path.name.isdigit() and int(path.name) > int(self.directory.name)
+        ]
+        for directory in slots:
+            if directory in self._orphans:
+                continue
+            try:
+                orphan = DataSpool(
+                    self.root,
+                    self.handler,
+                    key=self.key,
+                    retry_exceptions=self.retry_exceptions,
+                    retry_time=self.retry_time,
+                    directory=directory,
+                )
+            except BlockingIOError:
+                continue  # a live process owns it
+            if orphan._pending:
+                logger.warning(
+                    f"Draining {sum(orphan._pending.values())} records left in "
+                    f"orphaned spool {directory}"
+                )
+                self._orphans[directory] = orphan
+            else:
+                orphan.close()
+
+    def _drain_orphans(self):
+        for directory, orphan in list(self._orphans.items()):
+            orphan.drain()
+            if not orphan._pending:
+                orphan.close()
+                del self._orphans[directory]
+
+    def _run(self):
+        delay = 0
+        last_scan = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_scan >= self.retry_time:
+                    last_scan = time.monotonic()
+                    self._adopt_orphans()
+                self.drain()
+                self._drain_orphans()
+                busy = bool(self._pending or self._orphans)
+            except Exception:
+                # Keep the thread alive (e.g. through a full disk); the
+                # records stay in the spool until this succeeds.
+                logger.exception("Error while draining the spool, will retry")
+                busy = True
+            if busy:
+                # Either the handler failed or a record is not fully written
+                # yet; back off before trying again.
+                delay = min(max(delay * 2, 0.01), self.retry_time)
+                self._stop.wait(delay)
+            else:
+                delay = 0
+                self._wakeup.wait(self.retry_time)
+                self._wakeup.clear()
+
+    def start(self):
+        try:
+            self._adopt_orphans()
+        except Exception:
+            logger.exception("Could not check for orphaned spools, will retry")
+        self._thread = threading.Thread(target=self._run, name="data-spool", daemon=True)
+        self._thread.start()
+
+    def wait_until_drained(self, timeout=None):
+        """Block until every spooled record has been handled. Returns False
+        on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending or self._orphans:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        for orphan in self._orphans.values():
+            orphan.close()
+        self._orphans = {}
+        with self._cond:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+        self._lock_file.close()
@@ -0,0 +1,97 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlmodel import Session, select
+
+from models import DEFAULT_STUDY_ID, Study, StudyConfigurationIn
+
+
+@dataclass(frozen=True)
+class StudyConfiguration:
+    """Everything the server needs to know about one study."""
+
+    study_id: str
+    condition: str
+    allotted_time: int
+    experiment_configuration: Dict
+    updated_at: Optional[datetime] = None
+
+
+class StudyRegistry:
+    """In-memory cache of per-study configuration, keyed by study id.
+
+    Entries are re-validated against `study.updated_at` once they are older
+    than `ttl` seconds, so a change made through another worker process is
+    picked up without re-reading the whole row on every request. Changes made
+    in this process call `invalidate` and are seen immediately.
+    """
+
+    def __init__(self, experiment_configuration, condition, allotted_time, ttl):
+        self.default = StudyConfiguration(
+            study_id=DEFAULT_STUDY_ID,
+            condition=condition,
+            allotted_time=allotted_time,
+            experiment_configuration=dict(experiment_configuration),
+        )
+        self.ttl = ttl
+        self._entries = {}  # study_id -> (checked_at, StudyConfiguration)
+        self._lock = threading.Lock()
+
+    def build(self, study: Study) -> StudyConfiguration:
+        return StudyConfiguration(
+            study_id=study.study_id,
+            condition=study.condition or self.default.condition,
+            allotted_time=study.allotted_time or self.default.allotted_time,
+            experiment_configuration={
+                **self.default.experiment_configuration,
+                **{
+                    key: value
+                    for key, value in (study.configuration or {}).items()
+                    if key in StudyConfigurationIn.__fields__
+                },
+            },
+            updated_at=study.updated_at,
+        )
+
+    def get(self, session: Session, study_id: str) -> Optional[StudyConfiguration]:
+        """Return the configuration for `study_id`, or None if it is not
+        registered. The default study falls back to the settings when it has
+        no registry row."""
+        now = time.monotonic()
+        entry = self._entries.get(study_id)
+        if entry and now - entry[0] < self.ttl:
+            return entry[1]
+
+        cached = entry[1] if entry else None
+        if cached is not None:
+            updated_at = session.exec(
+                select(Study.updated_at).where(Study.study_id == study_id)
+            ).first()
+            if updated_at is not None and updated_at == cached.updated_at:
+                with self._lock:
+                    self._entries[study_id] = (now, cached)
+                return cached
+
+        study = session.exec(select(Study).where(Study.study_id == study_id)).first()
+        if study:
+            configuration = self.build(study)
+        elif study_id == DEFAULT_STUDY_ID:
+            configuration = self.default
+        else:
+            # Misses are not cached, so a study registered through another
+            # worker process is available right away
+            return None
+
+        with self._lock:
+            self._entries[study_id] = (now, configuration)
+        return configuration
+
+    def invalidate(self, study_id: Optional[str] = None):
+        with self._lock:
+            if study_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(study_id, None)
@@ -0,0 +1,268 @@
+"""Realistic synthetic participants and jsPsych trial data, for scale testing.
+
+Everything is generated from a seeded `random.Random`, so the same seed and
+`now` always give the same rows in an empty database. Times are offsets from `now`, so a database
+loaded with the current time has a realistic mix of participants who are still
+within their allotted time and participants the timeout sweep should catch.
+"""
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from random import Random
+
+from sqlalchemy import func, select, text
+from sqlmodel import SQLModel, create_engine
+
+import config
+from models import DEFAULT_STUDY_ID, POSSIBLE_PARTICIPANT_STATUSES, Data, Participant, Study
+
+# Roughly what a finished study on Prolific looks like
+STATUS_WEIGHTS = {
+    "complete": 0.70,
+    "timeout": 0.12,
+    "failed": 0.03,
+    "working": 0.15,
+}
+PLATFORM_WEIGHTS = {"prolific": 0.8, "turk": 0.15, "connect": 0.05}
+NUM_IMAGES = 150  # frontend/src/images/AllPic
+DAYS_RUNNING = 14  # how far back start times go
+# Trials per completed participant; real participants do about 200, which
+# makes large loads roughly ten times slower and larger
+DEFAULT_NUM_TRIALS = 20
+# Fixtures are pinned to this time so that they are identical for a given seed
+FIXTURE_TIME = datetime(2024, 1, 3)
+
+logger = logging.getLogger(__name__)
+
+
+def generate_id(rng, length=24):
+    """A hex id that looks like a Prolific PID, study id, or session id."""
+    return "".join(rng.choices("0123456789abcdef", k=length))
+
+
+def generate_trial_data(rng, num_trials=DEFAULT_NUM_TRIALS, worker_id=None):
+    """Generate jsPsych data for one participant: instructions, rating trials
+    (image-slider-response), and a closing survey. Returns the list of trial
+    dictionaries as jsPsych's `data.get().values()` would."""
+    trials = []
+    time_elapsed = 0
+
+    def add_trial(trial_type, rt, **fields):
+        nonlocal time_elapsed
+        time_elapsed += rt + 100  # intertrial interval
+        trials.append(
+            {
+                "rt": rt,
+                "trial_type": trial_type,
+                "trial_index": len(trials),
+                "time_elapsed": time_elapsed,
+                "internal_node_id": f"0.0-{len(trials)}.0",
+                "worker_id": worker_id,
+                **fields,
+            }
+        )
+
+    num_instructions = min(3, num_trials)
+    for i in range(num_instructions):
+        add_trial(
+            "html-button-response",
+            int(rng.lognormvariate(9, 0.6)),
+            stimulus=f"instructions_page_{i}",
+            response=0,
+        )
+
+    num_ratings = max(num_trials - num_instructions - 1, 0)
+    for i in range(num_ratings):
+        add_trial(
+            "image-slider-response",
+            int(rng.lognormvariate(7.5, 0.4)),
+            stimulus=f"src/images/AllPic/{rng.randint(1, NUM_IMAGES)}.jpeg",
+            response=rng.randint(0, 100),
+            slider_start=50,
+            is_practice=i < 3,
+        )
+
+    if num_trials > num_instructions:
+        add_trial(
+            "survey-html-form",
+            int(rng.lognormvariate(10, 0.5)),
+            response=json.dumps(
+                {
+                    "age": str(rng.randint(18, 75)),
+                    "gender": rng.choice(["female", "male", "nonbinary", ""]),
+                    "comments": "",
+                }
+            ),
+        )
+
+    return trials
+
+
+def generate_participant(
+    rng,
+    now,
+    allotted_time,
+    study_id=DEFAULT_STUDY_ID,
+    num_trials=DEFAULT_NUM_TRIALS,
+):
+    """Generate one participant row, and their trial data if they finished.
+    Returns (participant, json_data); json_data is None for participants who
+    never submitted data. `allotted_time` (in seconds) should match the
+    server's, so that half of the working participants have expired."""
+    worker_id = generate_id(rng)
+    status = rng.choices(list(STATUS_WEIGHTS), weights=STATUS_WEIGHTS.values())[0]
+    if status == "working":
+        status = rng.choice(POSSIBLE_PARTICIPANT_STATUSES["working"])
+        # Half are still within their allotted time, half have expired but
+        # have not been swept yet
+        start_time = now - timedelta(seconds=rng.uniform(0, 2 * allotted_time))
+    else:
+        start_time = now - timedelta(days=rng.uniform(0, DAYS_RUNNING))
+
+    end_time = None
+    if status == "complete":
+        end_time = start_time + timedelta(seconds=rng.lognormvariate(7, 0.3))
+
+    participant = {
+        "study_id": study_id,
+        "worker_id": worker_id,
+        "hit_id": generate_id(rng),
+        "assignment_id": generate_id(rng),
+        "platform": rng.choices(
+            list(PLATFORM_WEIGHTS), weights=PLATFORM_WEIGHTS.values()
+        )[0],
+        "condition": "trustworthy",
+        "created_at": start_time,
+        "start_time": start_time,
+        "end_time": end_time,
+        "status": status,
+    }
+    json_data = None
+    if status == "complete":
+        json_data = generate_trial_data(rng, num_trials, worker_id=worker_id)
+    return participant, json_data
+
+
+def bulk_load(
+    engine,
+    num_participants,
+    seed=0,
+    num_trials=DEFAULT_NUM_TRIALS,
+    num_studies=1,
+    batch_size=5000,
+    now=None,
+    allotted_time=None,
+):
+    """Insert `num_participants` synthetic participants, and data for those
+    who completed, with one multi-row insert per table per batch.
+
+    With `num_studies` > 1, participants are spread over registered studies
+    `study_000`, `study_001`, and so on; otherwise they all belong to the
+    default study. `allotted_time` defaults to the configured one. Returns
+    the number of participants inserted.
+
+    The random state depends on `seed` and on how many participants are
+    already in the database, so loading twice with the same seed adds new
+    participants rather than repeating the worker ids of the first load.
+    """
+    now = now or datetime.utcnow()
+    allotted_time = allotted_time or config.Settings().allotted_time
+    participant_table = Participant.__table__
+    data_table = Data.__table__
+
+    study_ids = [DEFAULT_STUDY_ID]
+    if num_studies > 1:
+        study_ids = [f"study_{i:03d}" for i in range(num_studies)]
+
+    with engine.begin() as conn:
+        num_existing = conn.execute(
+            select(func.count()).select_from(participant_table)
+        ).scalar()
+        next_data_id = (conn.execute(select(func.max(data_table.c.id))).scalar() or 0) + 1
+        if num_studies > 1:
+            existing = set(conn.execute(select(Study.__table__.c.study_id)).scalars())
+            new_studies = [
+                {
+                    "study_id": study_id,
+                    "configuration": {"experiment_name": study_id},
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for study_id in study_ids
+                if study_id not in existing
+            ]
+            if new_studies:
+                conn.execute(Study.__table__.insert(), new_studies)
+
+    rng = Random(f"{seed}:{num_existing}")
+    for batch_start in range(0, num_participants, batch_size):
+        participants = []
+        data = []
+        for _ in range(min(batch_size, num_participants - batch_start)):
+            participant, json_data = generate_participant(
+                rng,
+                now,
+                allotted_time,
+                study_id=rng.choice(study_ids),
+                num_trials=num_trials,
+            )
+            if json_data is not None:
+                participant["data_id"] = next_data_id
+                data.append(
+                    {
+                        "id": next_data_id,
+                        "study_id": participant["study_id"],
+                        "worker_id": participant["worker_id"],
+                        "condition": participant["condition"],
+                        "json_data": json_data,
+                    }
+                )
+                next_data_id += 1
+            else:
+                participant["data_id"] = None
+            participants.append(participant)
+
+        with engine.begin() as conn:
+            if data:
+                conn.execute(data_table.insert(), data)
+            conn.execute(participant_table.insert(), participants)
+
+    if engine.dialect.name == "postgresql":
+        # Explicit ids don't advance the sequence
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "SELECT setval(pg_get_serial_sequence('data', 'id'), "
+                    "(SELECT max(id) FROM data))"
+                )
+            )
+
+    return num_participants
+
+
+def fixture_database(
+    path,
+    num_participants,
+    seed=0,
+    num_trials=DEFAULT_NUM_TRIALS,
+    now=FIXTURE_TIME,
+    **kwargs,
+):
+    """Create a fresh SQLite database at `path` filled by `bulk_load`, for
+    benchmarks of `/status`, the timeout sweep, and `cli.py export`. Times
+    are relative to `FIXTURE_TIME` unless `now` is given, so the same seed
+    always gives the same database. Returns the engine."""
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    start = time.perf_counter()
+    bulk_load(
+        engine, num_participants, seed=seed, num_trials=num_trials, now=now, **kwargs
+    )
+    logger.info(
+        f"Loaded {num_participants} participants into {path} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return engine
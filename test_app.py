@@ -10,6 +10,7 @@ import requests
 
 from cli import reset_db
 from config import Settings
+from synthetic_data import DEFAULT_NUM_TRIALS, generate_trial_data
 
 settings = Settings()
 base_url = "http://127.0.0.1:8000"
@@ -32,20 +33,10 @@ def generate_participant_info():
     }
 
 
-def generate_dummy_trial_data():
-    """Generates dummy trial data in the form of a list of dictionaries.
-    Does not actually look like real trial data in the context of the experiment."""
-    length = 5
-    return [
-        {
-            "entry_1": generate_random_string(length=length),
-            "entry_2": generate_random_string(length=length),
-        },
-        {
-            "entry_1": generate_random_string(length=length),
-            "entry_2": generate_random_string(length=length),
-        },
-    ]
+def generate_dummy_trial_data(num_trials=DEFAULT_NUM_TRIALS):
+    """Generates dummy trial data in the form of a list of dictionaries,
+    shaped like the jsPsych data the experiment posts. See `synthetic_data`."""
+    return generate_trial_data(random.Random(), num_trials=num_trials)
 
 
 # @pysnooper.snoop()
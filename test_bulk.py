@@ -0,0 +1,146 @@
+# Run with `python -m pytest test_bulk.py`. See conftest.py.
+
+import json
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session, select
+
+from conftest import AUTH
+from models import Participant
+from synthetic_data import fixture_database
+
+
+@pytest.fixture
+def client(tmp_path, use_engine):
+    engine = fixture_database(tmp_path / "database.db", 200, seed=1, num_trials=3)
+    return use_engine(engine), engine
+
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def statuses(engine):
+    with Session(engine) as session:
+        rows = session.exec(select(Participant.worker_id, Participant.status))
+        return {worker_id: status for worker_id, status in rows}
+
+
+def test_bulk_endpoints_need_credentials(client):
+    client, engine = client
+    body = {"statuses": ["timeout"], "status": "failed"}
+    assert client.post("/participants/bulk/status", json=body).status_code == 401
+    assert client.post("/participants/bulk/data", json=body).status_code == 401
+
+
+def test_bulk_endpoints_need_a_filter(client):
+    client, engine = client
+    before = statuses(engine)
+    response = client.post(
+        "/participants/bulk/status", json={"status": "failed"}, auth=AUTH
+    )
+    assert response.status_code == 422
+    response = client.post("/participants/bulk/data", json={}, auth=AUTH)
+    assert response.status_code == 422
+    assert statuses(engine) == before
+
+
+@pytest.mark.parametrize("status", ["complete", "finished"])
+def test_bulk_status_must_be_settable(client, status):
+    client, engine = client
+    before = statuses(engine)
+    response = client.post(
+        "/participants/bulk/status",
+        json={"worker_ids": list(before), "status": status},
+        auth=AUTH,
+    )
+    assert response.status_code == 422
+    assert statuses(engine) == before
+
+
+def test_complete_participants_are_never_changed(client):
+    client, engine = client
+    before = statuses(engine)
+    response = client.post(
+        "/participants/bulk/status",
+        json={"worker_ids": list(before), "status": "failed"},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+
+    updated = {p["worker_id"] for p in read_ndjson(response)}
+    assert updated == {w for w, s in before.items() if s != "complete"}
+    after = statuses(engine)
+    for worker_id, status in before.items():
+        expected = "complete" if status == "complete" else "failed"
+        assert after[worker_id] == expected
+
+
+def test_reopen_timeouts(client):
+    client, engine = client
+    before = statuses(engine)
+    timed_out = {w for w, s in before.items() if s == "timeout"}
+    assert timed_out
+
+    start_time = datetime(2024, 1, 3, 12)
+    response = client.post(
+        "/participants/bulk/status",
+        json={
+            "statuses": ["timeout"],
+            "status": "working",
+            "start_time": start_time.isoformat(),
+        },
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    rows = read_ndjson(response)
+    assert {row["worker_id"] for row in rows} == timed_out
+    for row in rows:
+        assert row["status"] == "working"
+        assert row["start_time"] == start_time.isoformat()
+    after = statuses(engine)
+    assert all(after[w] == "working" for w in timed_out)
+    assert {w for w, s in after.items() if s == "timeout"} == set()
+
+
+def test_bulk_data_includes_participants_without_data(client):
+    client, engine = client
+    before = statuses(engine)
+    complete = next(w for w, s in before.items() if s == "complete")
+    failed = next(w for w, s in before.items() if s == "failed")
+
+    response = client.post(
+        "/participants/bulk/data",
+        json={"worker_ids": [complete, failed]},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+    rows = {row["worker_id"]: row for row in read_ndjson(response)}
+    assert set(rows) == {complete, failed}
+    assert rows[failed]["data"] is None
+    assert rows[complete]["data"]["id"] == rows[complete]["data_id"]
+    assert len(rows[complete]["data"]["json_data"]) == 3
+
+
+def test_more_worker_ids_than_sqlite_can_bind(client):
+    client, engine = client
+    before = statuses(engine)
+    timed_out = [w for w, s in before.items() if s == "timeout"]
+    worker_ids = [f"nobody_{i}" for i in range(40000)] + timed_out
+
+    response = client.post(
+        "/participants/bulk/status",
+        json={"worker_ids": worker_ids, "status": "failed"},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+    assert {row["worker_id"] for row in read_ndjson(response)} == set(timed_out)
+
+    response = client.post(
+        "/participants/bulk/data", json={"worker_ids": worker_ids}, auth=AUTH
+    )
+    assert response.status_code == 200
+    assert {row["worker_id"] for row in read_ndjson(response)} == set(timed_out)
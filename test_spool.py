@@ -0,0 +1,270 @@
+# Run with `python -m pytest test_spool.py`. Unlike test_app.py, this does not
+# need a running server or the local database.
+
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import InterfaceError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import main
+from models import Data, Participant, ParticipantDataIn
+from spool import REJECTED_NAME, DataSpool
+from test_app import generate_dummy_trial_data, generate_participant_info
+
+
+def make_engine(db_path, db_state):
+    """An engine whose connections open the SQLite file read-only
+    whenever `db_state["read_only"]` is set."""
+
+    def connect():
+        mode = "ro" if db_state["read_only"] else "rwc"
+        return sqlite3.connect(
+            f"file:{db_path}?mode={mode}", uri=True, check_same_thread=False
+        )
+
+    return create_engine("sqlite://", creator=connect, poolclass=NullPool)
+
+
+def make_database(tmp_path, num_participants, db_state):
+    """Returns the engine, the participants (all about to submit), and the
+    trial data each of them will submit."""
+    engine = make_engine(tmp_path / "database.db", db_state)
+    SQLModel.metadata.create_all(engine)
+
+    participants = [generate_participant_info() for _ in range(num_participants)]
+    trial_data = {p["worker_id"]: generate_dummy_trial_data() for p in participants}
+    with Session(engine) as session:
+        for p in participants:
+            session.add(Participant(**p, status="working_finished_survey"))
+        session.commit()
+    return engine, participants, trial_data
+
+
+def make_spool(spool_dir, engine, failures=(), start=True):
+    """A spool saving to `engine`. The handler raises each exception in
+    `failures` once before it starts saving."""
+    failures = list(failures)
+
+    def handler(record):
+        if failures:
+            raise failures.pop(0)
+        with Session(engine) as session:
+            main.save_subject_data(session, ParticipantDataIn(**record))
+
+    spool = DataSpool(
+        spool_dir,
+        handler=handler,
+        key=lambda record: (record["study_id"], record["worker_id"]),
+        retry_exceptions=main.DATABASE_RETRY_EXCEPTIONS,
+        segment_size=4096,
+        retry_time=0.05,
+    )
+    if start:
+        spool.start()
+    return spool
+
+
+def post_data(spool, participants, trial_data):
+    main.app.dependency_overrides[main.get_data_spool] = lambda: spool
+    client = TestClient(main.app)
+    try:
+        for p in participants:
+            response = client.post(
+                "/data", json={**p, "json_data": trial_data[p["worker_id"]]}
+            )
+            assert response.status_code == 200
+    finally:
+        del main.app.dependency_overrides[main.get_data_spool]
+
+
+def assert_all_saved(engine, trial_data):
+    with Session(engine) as session:
+        saved = session.exec(select(Data)).all()
+        assert sorted(d.worker_id for d in saved) == sorted(trial_data)
+        for d in saved:
+            assert d.json_data == trial_data[d.worker_id]
+        statuses = session.exec(select(Participant.status)).all()
+        assert set(statuses) == {"complete"}
+
+
+def test_no_data_lost_when_database_goes_down(tmp_path):
+    num_participants = 40
+    db_state = {"read_only": False}
+    engine, participants, trial_data = make_database(
+        tmp_path, num_participants, db_state
+    )
+
+    spool_dir = tmp_path / "spool"
+    spool = make_spool(spool_dir, engine)
+    try:
+        half = num_participants // 2
+        post_data(spool, participants[:half], trial_data)
+        db_state["read_only"] = True
+        post_data(spool, participants[half:], trial_data)
+
+        # The database is still down when the process goes away
+        spool.close()
+        with Session(engine) as session:
+            assert len(session.exec(select(Data)).all()) < num_participants
+
+        db_state["read_only"] = False
+        spool = make_spool(spool_dir, engine)
+        assert spool.directory == spool_dir / "0"
+        assert spool.wait_until_drained(timeout=10)
+
+        # Replaying a submission once it is saved does not add a second copy
+        post_data(spool, participants[:1], trial_data)
+        assert spool.wait_until_drained(timeout=10)
+    finally:
+        spool.close()
+
+    assert_all_saved(engine, trial_data)
+
+
+def test_rerun_data_is_saved(tmp_path):
+    engine, participants, trial_data = make_database(tmp_path, 1, {"read_only": False})
+    worker_id = participants[0]["worker_id"]
+    rerun_data = {worker_id: generate_dummy_trial_data()}
+    spool = make_spool(tmp_path / "spool", engine)
+    try:
+        post_data(spool, participants, trial_data)
+        assert spool.wait_until_drained(timeout=10)
+        post_data(spool, participants, rerun_data)
+        assert spool.wait_until_drained(timeout=10)
+    finally:
+        spool.close()
+
+    # Both runs are kept, and the participant points at the latest
+    with Session(engine) as session:
+        saved = session.exec(select(Data).order_by(Data.id)).all()
+        assert [d.json_data for d in saved] == [
+            trial_data[worker_id],
+            rerun_data[worker_id],
+        ]
+        participant = session.exec(select(Participant)).one()
+        assert participant.data_id == saved[-1].id
+
+
+def test_slow_database_errors_are_retried(tmp_path):
+    engine, participants, trial_data = make_database(tmp_path, 5, {"read_only": False})
+    failures = [
+        PoolTimeoutError("QueuePool limit of size 5 overflow 10 reached"),
+        InterfaceError("SELECT 1", {}, Exception("connection already closed")),
+    ]
+    spool = make_spool(tmp_path / "spool", engine, failures=failures)
+    try:
+        post_data(spool, participants, trial_data)
+        assert spool.wait_until_drained(timeout=10)
+    finally:
+        spool.close()
+
+    assert not (spool.directory / REJECTED_NAME).exists()
+    assert_all_saved(engine, trial_data)
+
+
+def test_orphaned_slots_are_drained(tmp_path):
+    db_state = {"read_only": False}
+    engine, participants, trial_data = make_database(tmp_path, 10, db_state)
+    db_state["read_only"] = True
+
+    # Two processes take data while the database is down, then only one
+    # comes back
+    spool_dir = tmp_path / "spool"
+    first = make_spool(spool_dir, engine)
+    second = make_spool(spool_dir, engine)
+    post_data(first, participants[:5], trial_data)
+    post_data(second, participants[5:], trial_data)
+    first.close()
+    second.close()
+
+    db_state["read_only"] = False
+    spool = make_spool(spool_dir, engine)
+    try:
+        assert spool.directory == spool_dir / "0"
+        assert spool.wait_until_drained(timeout=10)
+    finally:
+        spool.close()
+
+    assert_all_saved(engine, trial_data)
+
+
+def test_drain_survives_unreadable_records(tmp_path):
+    engine, participants, trial_data = make_database(tmp_path, 4, {"read_only": False})
+    spool = make_spool(tmp_path / "spool", engine, start=False)
+    try:
+        post_data(spool, participants[:2], trial_data)
+        with open(spool._segment_path(spool._write_segment), "ab") as file:
+            file.write(b"{not json\n")
+        post_data(spool, participants[2:], trial_data)
+        spool.start()
+        assert spool.wait_until_drained(timeout=10)
+    finally:
+        spool.close()
+
+    assert (spool.directory / REJECTED_NAME).read_bytes() == b"{not json\n"
+    assert_all_saved(engine, trial_data)
+
+
+class FullDisk:
+    """A segment file that runs out of space partway through a write: the
+    first write is short and the next one raises. With `truncate_fails`, the
+    partial line cannot be truncated away either."""
+
+    def __init__(self, file, truncate_fails=False):
+        self.file = file
+        self.writes = 0
+        self.truncate_fails = truncate_fails
+
+    def write(self, data):
+        self.writes += 1
+        if self.writes == 1:
+            return self.file.write(data[: len(data) // 2])
+        if self.writes == 2:
+            raise OSError(28, "No space left on device")
+        return self.file.write(data)
+
+    def truncate(self, size):
+        if self.truncate_fails:
+            raise OSError(28, "No space left on device")
+        return self.file.truncate(size)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_drain_survives_disk_errors(tmp_path):
+    engine, participants, trial_data = make_database(tmp_path, 4, {"read_only": False})
+    spool = make_spool(tmp_path / "spool", engine, start=False)
+
+    # Appends that hit a full disk fail, without leaving a partial line in
+    # front of the next record
+    for p, truncate_fails in zip(participants, [False, True]):
+        segment = spool._open_segment(spool._write_segment)
+        spool._file = FullDisk(segment, truncate_fails)
+        record = ParticipantDataIn(**p, json_data=trial_data[p["worker_id"]])
+        with pytest.raises(OSError):
+            spool.append(record.dict())
+        assert not spool._pending
+
+    save_checkpoint = spool._save_checkpoint
+    failures = [OSError(28, "No space left on device")]
+
+    def flaky_save_checkpoint():
+        if failures:
+            raise failures.pop(0)
+        save_checkpoint()
+
+    spool._save_checkpoint = flaky_save_checkpoint
+    try:
+        post_data(spool, participants, trial_data)
+        spool.start()
+        assert spool.wait_until_drained(timeout=10)
+        assert spool._thread.is_alive()
+    finally:
+        spool.close()
+
+    assert_all_saved(engine, trial_data)
@@ -0,0 +1,156 @@
+# Run with `python -m pytest test_studies.py`. See conftest.py.
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import cli
+import main
+from conftest import AUTH
+from models import Data, Participant
+from synthetic_data import fixture_database
+from test_app import generate_dummy_trial_data, generate_participant_info
+from test_spool import make_spool, post_data
+
+
+@pytest.fixture
+def client(use_engine):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return use_engine(engine), engine
+
+
+@pytest.mark.parametrize(
+    "configuration",
+    [{"condition": "happy"}, {"worker_id": "x"}, {"num_stimuli": "lots"}],
+)
+def test_invalid_study_configuration_is_rejected(client, configuration):
+    client, engine = client
+    response = client.put(
+        "/studies/s1", json={"configuration": configuration}, auth=AUTH
+    )
+    assert response.status_code == 422
+
+
+def test_init_uses_study_configuration(client):
+    client, engine = client
+    participant_info = {**generate_participant_info(), "study_id": "s1"}
+
+    # Unknown studies are not cached, so registering one takes effect at once
+    assert client.post("/init", json=participant_info).status_code == 404
+    response = client.put(
+        "/studies/s1",
+        json={"condition": "happy", "configuration": {"num_stimuli": 7}},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+
+    response = client.post("/init", json=participant_info)
+    assert response.status_code == 200
+    assert response.json()["condition"] == "happy"
+    assert response.json()["num_stimuli"] == 7
+    with Session(engine) as session:
+        participant = session.exec(select(Participant)).one()
+        assert participant.study_id == "s1"
+
+
+def add_participants(engine, study_id, num_participants, **fields):
+    participants = [
+        Participant(**generate_participant_info(), study_id=study_id, **fields)
+        for _ in range(num_participants)
+    ]
+    with Session(engine) as session:
+        session.add_all(participants)
+        session.commit()
+        return [p.worker_id for p in participants]
+
+
+def test_timeout_sweep_uses_study_allotted_time(client):
+    client, engine = client
+    response = client.put("/studies/s1", json={"allotted_time": 60}, auth=AUTH)
+    assert response.status_code == 200
+
+    # Past s1's allotted time, but well within the setting
+    start_time = datetime.utcnow() - timedelta(minutes=10)
+    assert main.allotted_time > 600
+    add_participants(engine, "default", 3, status="working", start_time=start_time)
+    s1 = add_participants(engine, "s1", 3, status="working", start_time=start_time)
+
+    with Session(engine) as session:
+        updated = main.time_out_participants(session)
+        assert sorted(p.worker_id for p in updated) == sorted(s1)
+        timed_out = session.exec(
+            select(Participant.study_id).where(Participant.status == "timeout")
+        ).all()
+        assert timed_out == ["s1"] * 3
+
+
+def test_status_is_scoped_by_study(client):
+    client, engine = client
+    add_participants(engine, "default", 2, status="working")
+    add_participants(engine, "s1", 3, status="working")
+    add_participants(engine, "s1", 1, status="failed")
+
+    response = client.get("/status", params={"study_id": "s1"}, auth=AUTH)
+    assert response.json() == [["failed", 1], ["working", 3]]
+    response = client.get("/status", params={"study_id": "default"}, auth=AUTH)
+    assert response.json() == [["working", 2]]
+    # Without a study_id, everyone is counted
+    response = client.get("/status", auth=AUTH)
+    assert response.json() == [["failed", 1], ["working", 5]]
+
+
+def test_data_is_scoped_by_study(client, tmp_path):
+    client, engine = client
+    worker_id = "same_worker_in_both_studies"
+    for study_id in ["default", "s1"]:
+        with Session(engine) as session:
+            session.add(
+                Participant(
+                    **{**generate_participant_info(), "worker_id": worker_id},
+                    study_id=study_id,
+                    status="working_finished_survey",
+                )
+            )
+            session.commit()
+
+    spool = make_spool(tmp_path / "spool", engine)
+    try:
+        post_data(
+            spool,
+            [{"worker_id": worker_id, "study_id": "s1", "condition": "happy"}],
+            {worker_id: generate_dummy_trial_data()},
+        )
+        assert spool.wait_until_drained(timeout=10)
+    finally:
+        spool.close()
+
+    with Session(engine) as session:
+        statuses = session.exec(select(Participant.study_id, Participant.status))
+        assert dict(statuses.all()) == {
+            "default": "working_finished_survey",
+            "s1": "complete",
+        }
+        assert session.exec(select(Data.study_id)).all() == ["s1"]
+
+
+def test_export_by_study(tmp_path, monkeypatch):
+    db_path = tmp_path / "database.db"
+    fixture_database(db_path, 100, num_studies=3)
+    monkeypatch.setattr(cli, "DATA_DIR", tmp_path)
+
+    cli.export(remote=False, study_id="study_001", db_path=db_path)
+    participants = pd.read_csv(tmp_path / "participant_study_001.csv")
+    data = pd.read_csv(tmp_path / "data_study_001.csv")
+    assert len(participants) > 0
+    assert set(participants["study_id"]) == {"study_001"}
+    assert set(data["study_id"]) == {"study_001"}
+    complete = participants[participants["status"] == "complete"]
+    assert set(data["worker_id"]) == set(complete["worker_id"])
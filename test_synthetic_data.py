@@ -0,0 +1,77 @@
+# Run with `python -m pytest test_synthetic_data.py`. Like test_spool.py, this
+# does not need a running server or the local database.
+
+from datetime import timedelta
+
+from sqlmodel import Session, create_engine, select
+
+import cli
+from models import POSSIBLE_PARTICIPANT_STATUSES, Data, Participant
+from synthetic_data import FIXTURE_TIME, bulk_load, fixture_database
+
+
+def read_rows(engine):
+    with Session(engine) as session:
+        participants = session.exec(select(Participant).order_by(Participant.id))
+        participants = [p.dict() for p in participants]
+        data = session.exec(select(Data).order_by(Data.id))
+        return participants, [d.dict() for d in data]
+
+
+def test_same_seed_gives_same_database(tmp_path):
+    first = fixture_database(tmp_path / "first.db", 300, seed=3, num_studies=2)
+    second = fixture_database(tmp_path / "second.db", 300, seed=3, num_studies=2)
+    other = fixture_database(tmp_path / "other.db", 300, seed=4, num_studies=2)
+    assert read_rows(first) == read_rows(second)
+    assert read_rows(first) != read_rows(other)
+
+    # The CLI passes the same defaults through
+    path = tmp_path / "cli.db"
+    cli.seed_fixture(path, num_participants=300, seed=3, num_studies=2)
+    assert read_rows(create_engine(f"sqlite:///{path}")) == read_rows(first)
+
+
+def test_complete_participants_have_their_data(tmp_path):
+    engine = fixture_database(tmp_path / "database.db", 300, num_studies=3)
+    participants, data = read_rows(engine)
+    data = {d["id"]: d for d in data}
+
+    complete = [p for p in participants if p["status"] == "complete"]
+    assert complete
+    assert len(data) == len(complete)
+    for p in participants:
+        if p["status"] == "complete":
+            assert data[p["data_id"]]["worker_id"] == p["worker_id"]
+            assert data[p["data_id"]]["study_id"] == p["study_id"]
+            assert p["end_time"] is not None
+        else:
+            assert p["data_id"] is None
+
+
+def test_working_participants_expire_for_allotted_time(tmp_path):
+    allotted_time = 600
+    engine = fixture_database(
+        tmp_path / "database.db", 1000, allotted_time=allotted_time
+    )
+    min_start_time = FIXTURE_TIME - timedelta(seconds=allotted_time)
+    with Session(engine) as session:
+        working = session.exec(
+            select(Participant).where(
+                Participant.status.in_(POSSIBLE_PARTICIPANT_STATUSES["working"])
+            )
+        ).all()
+
+    expired = [p for p in working if p.start_time < min_start_time]
+    assert 0 < len(expired) < len(working)
+    for p in working:
+        assert p.start_time >= min_start_time - timedelta(seconds=allotted_time)
+
+
+def test_loading_twice_does_not_repeat_worker_ids(tmp_path):
+    engine = fixture_database(tmp_path / "database.db", 200)
+    bulk_load(engine, 200, now=FIXTURE_TIME)
+    participants, data = read_rows(engine)
+    assert len(participants) == 400
+    worker_ids = [p["worker_id"] for p in participants]
+    assert len(set(worker_ids)) == len(worker_ids)
+    assert len({d["id"] for d in data}) == len(data)